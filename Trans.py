@@ -1,10 +1,16 @@
 import streamlit as st
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
+import time
+import threading
 import pandas as pd
 import plotly.express as px
 from authlib.integrations.requests_client import OAuth2Session
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from io import BytesIO
-import matplotlib.pyplot as plt
+from PIL import Image, ImageDraw, ImageFont
 
 # 🔹 Google OAuth Credentials (Loaded from Streamlit Secrets)
 CLIENT_ID = st.secrets["CLIENT_ID"]
@@ -12,14 +18,14 @@ CLIENT_SECRET = st.secrets["CLIENT_SECRET"]
 REDIRECT_URI = st.secrets["REDIRECT_URI"]
 
 # 🔹 Allowed Emails (Loaded from Streamlit Secrets)
-ALLOWED_EMAILS = st.secrets["ALLOWED_EMAILS"].split(",")  # Convert to list
+ALLOWED_EMAILS = frozenset(e.strip().lower() for e in st.secrets["ALLOWED_EMAILS"].split(",") if e.strip())  # Normalized set, no empty entries
 
 # 🔹 Metabase credentials (Loaded from Streamlit Secrets)
 METABASE_URL = st.secrets["METABASE_URL"]
 METABASE_USERNAME = st.secrets["METABASE_USERNAME"]
 METABASE_PASSWORD = st.secrets["METABASE_PASSWORD"]
 
-# Initialize OAuth2 session
+# Initialize OAuth2 session (built per run: it holds the logged-in user's token, so it must not be shared)
 oauth = OAuth2Session(
     CLIENT_ID, CLIENT_SECRET, redirect_uri=REDIRECT_URI, scope=["openid", "email", "profile"]
 )
@@ -69,7 +75,7 @@ if user_info:
     st.write(f"Authenticated Email: {email}")  # Debugging: Print the email
     
     # Check if the email is in the allowed list
-    if email in ALLOWED_EMAILS:
+    if email.strip().lower() in ALLOWED_EMAILS:
         st.success(f"✅ Welcome, {email}!")
     else:
         st.error(f"❌ Access Denied! Your email ({email}) is not allowed.")
@@ -79,78 +85,226 @@ else:
     st.stop()
 
 # 🔹 Fetch data from Metabase
+# Shared HTTP session so the login and all card queries reuse pooled keep-alive connections
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+    session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+    return session
+
+http_session = get_http_session()
+
+METABASE_SESSION_TTL = 60 * 50  # Metabase sessions last ~14 days, re-login well before that
+
+@st.cache_resource(ttl=METABASE_SESSION_TTL, show_spinner=False)
 def get_metabase_session():
     login_url = f"{METABASE_URL}/api/session"
     credentials = {"username": METABASE_USERNAME, "password": METABASE_PASSWORD}
 
+    response = http_session.post(login_url, json=credentials)
+    response.raise_for_status()
+    return response.json().get("id")
+
+def get_metabase_token(force_refresh=False):
+    # Cached session token, only logs in again when expired or rejected
+    cached = st.session_state.get("mb_session")
+    if not force_refresh and cached and cached["expires_at"] > time.time():
+        return cached["token"]
+
+    if force_refresh:
+        get_metabase_session.clear()
+
     try:
-        response = requests.post(login_url, json=credentials)
-        response.raise_for_status()
-        return response.json().get("id")
+        token = get_metabase_session()
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Metabase Authentication Failed! Error: {e}")
         return None
 
-def fetch_metabase_data(query_id):
-    session_token = get_metabase_session()
-    if not session_token:
+    if not token:
+        get_metabase_session.clear()
+        st.session_state.pop("mb_session", None)
         return None
 
+    st.session_state["mb_session"] = {"token": token, "expires_at": time.time() + METABASE_SESSION_TTL}
+    return token
+
+class MetabaseError(Exception):
+    pass
+
+# Columns with a known type: always coerced to numbers / parsed with the card's date format
+NUMERIC_COLUMNS = ["Total Vehicles"]
+DATE_FORMATS = {"Scheduled At": "%d-%b-%Y"}
+
+def apply_column_types(df):
+    # Type the columns once on load: parse date columns ("... At" / "... Date") and numeric values,
+    # downcast integer columns and store repetitive text columns as categories
+    for col in df.columns:
+        is_text = df[col].dtype == object or pd.api.types.is_string_dtype(df[col])
+        if col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        elif col in DATE_FORMATS:
+            df[col] = pd.to_datetime(df[col], format=DATE_FORMATS[col], errors='coerce')
+        elif is_text and str(col).endswith(("At", "Date")):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif is_text and pd.api.types.infer_dtype(df[col], skipna=True) in ('integer', 'floating', 'mixed-integer-float'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif (df[col].dtype == object or pd.api.types.is_string_dtype(df[col])) and df[col].nunique() < len(df) / 2:
+            df[col] = df[col].astype('category')
+    return df
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_metabase_data(query_id, _session_token=None):
+    # Cached per query_id; failures raise instead of returning None so they aren't cached
+    session_token = _session_token or get_metabase_token()
+    if not session_token:
+        raise MetabaseError("Metabase Authentication Failed!")
+
     query_url = f"{METABASE_URL}/api/card/{query_id}/query/json"
-    headers = {"X-Metabase-Session": session_token}
 
-    try:
-        response = requests.post(query_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Debugging: Print the raw data
-        st.write("Raw Data from Metabase:")
-        st.write(data)
-        
-        # Check if the response contains an error
-        if "error" in data:
-            st.error(f"❌ Metabase Query Error: {data['error']}")
-            return None
-        
-        # Ensure the data is in the expected format
-        if not isinstance(data, dict) or not all(isinstance(v, list) for v in data.values()):
-            st.error("❌ Unexpected data format returned from Metabase.")
-            return None
-        
-        # Ensure all columns have the same length
-        max_length = max(len(v) for v in data.values())
-        for key in data:
-            data[key] = data[key] + [None] * (max_length - len(data[key]))
-        
-        return pd.DataFrame(data)
-    except requests.exceptions.RequestException as e:
-        st.error(f"❌ Error fetching data: {e}")
+    response = http_session.post(query_url, headers={"X-Metabase-Session": session_token})
+    if response.status_code == 401:
+        # Session expired on the Metabase side, log in again and retry once
+        session_token = get_metabase_token(force_refresh=True)
+        if not session_token:
+            raise MetabaseError("Metabase Authentication Failed!")
+        response = http_session.post(query_url, headers={"X-Metabase-Session": session_token})
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+
+    # Check if the response contains an error
+    if "error" in data:
+        raise MetabaseError(f"Metabase Query Error: {data['error']}")
+
+    # Ensure the data is in the expected format
+    if not isinstance(data, dict) or not all(isinstance(v, list) for v in data.values()):
+        raise MetabaseError("Unexpected data format returned from Metabase.")
+
+    # Ensure all columns have the same length (pad in place, no list copies)
+    max_length = max(len(v) for v in data.values())
+    for values in data.values():
+        values.extend([None] * (max_length - len(values)))
+
+    return apply_column_types(pd.DataFrame(data))
+
+def fetch_all_metabase_data(query_ids, debug=False):
+    # Log in once up front so the workers don't each hit /api/session
+    session_token = get_metabase_token()
+    if not session_token:
+        return [None] * len(query_ids)
+
+    ctx = get_script_run_ctx()
+
+    def fetch(query_id):
+        # Attach the script context so st.* calls from the worker still render
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return fetch_metabase_data(query_id, session_token)
+        except MetabaseError as e:
+            st.error(f"❌ {e}")
+        except requests.exceptions.RequestException as e:
+            st.error(f"❌ Error fetching data: {e}")
+        except Exception as e:
+            st.error(f"❌ Error fetching data for Query ID {query_id}: {e}")
         return None
 
-# Function to convert DataFrame to PNG
-def dataframe_to_image(df, title="App Not Deployed - Real Time Data"):
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.axis('tight')
-    ax.axis('off')
+    with ThreadPoolExecutor(max_workers=len(query_ids)) as executor:
+        results = list(executor.map(fetch, query_ids))
+
+    # Debugging: Print the loaded data (after column typing)
+    if debug:
+        for query_id, df in zip(query_ids, results):
+            st.write(f"Parsed Data from Metabase (Query ID {query_id}):")
+            st.write(df)
 
-    # Set the title
-    ax.set_title(title, fontsize=14, fontweight="bold", pad=20)
+    return results
 
-    # Create the table
-    table = ax.table(cellText=df.values, colLabels=df.columns, cellLoc='center', loc='center')
+# Function to convert DataFrame to PNG
+TABLE_FONT_SIZE = 20
+TABLE_PADDING = 8
 
-    # Adjust the table properties
-    table.auto_set_font_size(False)
-    table.set_fontsize(10)
-    table.auto_set_column_width([i for i in range(len(df.columns))])
+def load_font(size):
+    # Monospace font so column widths can be computed from character counts
+    try:
+        return ImageFont.truetype("DejaVuSansMono.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
 
-    # Save the figure to a BytesIO object
+@st.cache_data(show_spinner=False)
+def dataframe_to_image(df, title="App Not Deployed - Real Time Data"):
+    font = load_font(TABLE_FONT_SIZE)
+    title_font = load_font(TABLE_FONT_SIZE + 8)
+    pad = TABLE_PADDING
+
+    # Size each column from its longest value
+    header = [str(c) for c in df.columns]
+    cells = df.astype(object).where(df.notna(), "").astype(str)
+    char_width = font.getlength("M")
+    col_widths = [
+        int(max(len(name), int(cells.iloc[:, i].str.len().max()) if len(cells) else 0) * char_width) + 2 * pad
+        for i, name in enumerate(header)
+    ]
+    row_height = TABLE_FONT_SIZE + 2 * pad
+    title_height = TABLE_FONT_SIZE + 8 + 4 * pad
+    table_width = sum(col_widths)
+
+    width = max(table_width, int(title_font.getlength(title))) + 2 * pad
+    height = title_height + row_height * (len(cells) + 1) + pad
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+
+    # Draw the title
+    draw.text((width / 2, title_height / 2), title, font=title_font, fill="black", anchor="mm")
+
+    # Draw the header row and the cells
+    draw.rectangle([pad, title_height, pad + table_width, title_height + row_height], fill="#e6e6e6")
+    y = title_height
+    for row in [header] + cells.values.tolist():
+        x = pad
+        for text, col_width in zip(row, col_widths):
+            draw.rectangle([x, y, x + col_width, y + row_height], outline="black")
+            draw.text((x + col_width / 2, y + row_height / 2), text, font=font, fill="black", anchor="mm")
+            x += col_width
+        y += row_height
+
+    # Save the image to a BytesIO object
     img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=300)
+    img.save(img_buffer, format="PNG")
     img_buffer.seek(0)
     return img_buffer
 
+# Function to count rows per value of a column
+def count_by(df, col, name):
+    # value_counts on a categorical also lists unused categories, so drop zero counts
+    counts = df[col].value_counts()
+    return counts[counts > 0].sort_index().rename_axis(col).reset_index(name=name)
+
+# Display a vehicle schedule dataset: table, PNG export and customer-wise bar chart
+def render_dataset(df, title, chart_subheader, file_name):
+    st.write(f"### 🔹 {title}")
+    st.dataframe(df)
+
+    # Convert DataFrame to PNG only when the user asks for an export
+    if st.checkbox("📷 Prepare PNG export", key=f"png_export_{file_name}"):
+        img_buffer = dataframe_to_image(df)
+
+        # PNG Download Button
+        st.download_button(
+            label="📷 Download Table as PNG",
+            data=img_buffer,
+            file_name=f"{file_name}.png",
+            mime="image/png"
+        )
+
+    # Bar Chart: Customer-wise Total Vehicle Count
+    st.subheader(chart_subheader)
+    df_customer_vehicles = df.groupby('Customer', observed=True)['Total Vehicles'].sum().reset_index()
+
+    st.bar_chart(df_customer_vehicles, x='Customer', y='Total Vehicles')
+
 # Streamlit UI
 st.title("📊 Metabase Data Viewer & Driver Analysis")
 st.sidebar.header("🔍 Query Settings")
@@ -161,77 +315,28 @@ query_id_3 = st.sidebar.number_input("Enter Metabase Query ID (First Dataset)",
 query_id_4 = st.sidebar.number_input("Enter Metabase Query ID (First Dataset)", min_value=1, value=3003, step=1)
 query_id_2 = st.sidebar.number_input("Enter Metabase Query ID (Second Dataset)", min_value=1, value=3023, step=1)
 
-# Fetch data
-df_1 = fetch_metabase_data(query_id_1)
-df_3 = fetch_metabase_data(query_id_3)
-df_4 = fetch_metabase_data(query_id_4)
-df_2 = fetch_metabase_data(query_id_2)
-
-## ------------------- QUERY 1: VEHICLE SCHEDULE DATA -------------------
-if df_1 is not None:
-    st.write("### 🔹 App Not Deployed - Real Time Data")
-    st.dataframe(df_1)
-
-    # Convert DataFrame to PNG
-    img_buffer = dataframe_to_image(df_1)
-
-    # PNG Download Button
-    st.download_button(
-        label="📷 Download Table as PNG",
-        data=img_buffer,
-        file_name="app_not_deployed_real_time_data_1.png",
-        mime="image/png"
-    )
-
-    # Bar Chart: Customer-wise Total Vehicle Count
-    st.subheader("📊 Customer-wise count of \"Not App Deployed\" for today")
-    df_1['Total Vehicles'] = pd.to_numeric(df_1['Total Vehicles'], errors='coerce')
-    df_customer_vehicles = df_1.groupby('Customer')['Total Vehicles'].sum().reset_index()
-    
-    fig_customer_bar = px.bar(
-        df_customer_vehicles, 
-        x='Customer', 
-        y='Total Vehicles', 
-        title="Total Vehicle Count per Customer", 
-        color='Total Vehicles', 
-        text_auto=True
-    )
-    st.plotly_chart(fig_customer_bar, key="plotly_chart_1")  # ✅ Added unique key
-else:
-    st.warning(f"⚠️ No data found for Query ID {query_id_1}.")
-
-## ------------------- QUERY 3: VEHICLE SCHEDULE DATA -------------------
-if df_3 is not None:
-    st.write("### 🔹 Accepted Trips - Real Time Data")  # Differentiate title
-    st.dataframe(df_3)
-
-    # Convert DataFrame to PNG
-    img_buffer = dataframe_to_image(df_3)
-
-    # PNG Download Button
-    st.download_button(
-        label="📷 Download Table as PNG",
-        data=img_buffer,
-        file_name="accepted_trips_real_time_data.png",  # Unique filename
-        mime="image/png"
-    )
-
-    # Bar Chart: Customer-wise Total Vehicle Count
-    st.subheader("📊 Customer-wise count of \"Accepted trip\" for today")
-    df_3['Total Vehicles'] = pd.to_numeric(df_3['Total Vehicles'], errors='coerce')  # Corrected reference
-    df_customer_vehicles = df_3.groupby('Customer')['Total Vehicles'].sum().reset_index()  # Corrected reference
-    
-    fig_customer_bar = px.bar(
-        df_customer_vehicles, 
-        x='Customer', 
-        y='Total Vehicles', 
-        title="Total Vehicle Count per Customer", 
-        color='Total Vehicles', 
-        text_auto=True
-    )
-    st.plotly_chart(fig_customer_bar, key="plotly_chart_3")  # ✅ Added unique key
-else:
-    st.warning(f"⚠️ No data found for Query ID {query_id_3}.")
+# Show the loaded Metabase data in the app
+DEBUG = st.sidebar.checkbox("🐞 Debug parsed responses", value=False)
+
+# Drop cached query results and fetch fresh data from Metabase
+if st.sidebar.button("🔄 Refresh data"):
+    st.cache_data.clear()
+
+# Fetch data (all queries run concurrently)
+df_1, df_3, df_4, df_2 = fetch_all_metabase_data([query_id_1, query_id_3, query_id_4, query_id_2], debug=DEBUG)
+
+## ------------------- QUERY 1 & 3: VEHICLE SCHEDULE DATA -------------------
+vehicle_datasets = [
+    (query_id_1, df_1, "App Not Deployed - Real Time Data", "📊 Customer-wise count of \"Not App Deployed\" for today",
+     "app_not_deployed_real_time_data_1"),
+    (query_id_3, df_3, "Accepted Trips - Real Time Data", "📊 Customer-wise count of \"Accepted trip\" for today",
+     "accepted_trips_real_time_data"),
+]
+for query_id, df, title, chart_subheader, file_name in vehicle_datasets:
+    if df is not None:
+        render_dataset(df, title, chart_subheader, file_name)
+    else:
+        st.warning(f"⚠️ No data found for Query ID {query_id}.")
 
 # Check if both dataframes exist
 if df_1 is not None and df_3 is not None:
@@ -248,16 +353,9 @@ if df_1 is not None and df_3 is not None:
     df_1_filtered["Status"] = "New"
     df_3_filtered["Status"] = "Accepted"
 
-    # Ensure 'Total Vehicles' is numeric
-    df_1_filtered["Total Vehicles"] = pd.to_numeric(df_1_filtered["Total Vehicles"], errors="coerce")
-    df_3_filtered["Total Vehicles"] = pd.to_numeric(df_3_filtered["Total Vehicles"], errors="coerce")
-
     # Compute grand total for Total Vehicles
     total_vehicles_sum = df_1_filtered["Total Vehicles"].sum() + df_3_filtered["Total Vehicles"].sum()
 
-    # Combine DataFrames
-    df_combined = pd.concat([df_1_filtered, df_3_filtered], ignore_index=True)
-
     # Create a single Grand Total row at the bottom (without unnecessary columns)
     grand_total_row = pd.DataFrame({
         "Duty Type": [""],  
@@ -271,8 +369,8 @@ if df_1 is not None and df_3 is not None:
         "Status": [""]
     })
 
-    # Append only one Grand Total row at the end
-    df_combined = pd.concat([df_combined, grand_total_row], ignore_index=True)
+    # Combine DataFrames with only one Grand Total row at the end, in a single concat
+    df_combined = pd.concat([df_1_filtered, df_3_filtered, grand_total_row], ignore_index=True)
 
     # Ensure that there are no duplicate or misplaced Grand Total rows
     df_combined = df_combined[~df_combined["Customer"].str.contains("Grand Total", na=False)]
@@ -281,37 +379,31 @@ if df_1 is not None and df_3 is not None:
     st.write("### 🔹 Combined Vehicle Schedule Data")
     st.dataframe(df_combined)
 
-    # Convert DataFrame to PNG
-    img_buffer = dataframe_to_image(df_combined)
+    # Convert DataFrame to PNG only when the user asks for an export
+    if st.checkbox("📷 Prepare PNG export", key="png_export_combined_vehicle_schedule_data"):
+        img_buffer = dataframe_to_image(df_combined)
 
-    # PNG Download Button
-    st.download_button(
-        label="📷 Download Table as PNG",
-        data=img_buffer,
-        file_name="combined_vehicle_schedule_data.png",
-        mime="image/png"
-    )
+        # PNG Download Button
+        st.download_button(
+            label="📷 Download Table as PNG",
+            data=img_buffer,
+            file_name="combined_vehicle_schedule_data.png",
+            mime="image/png"
+        )
 
 if df_4 is not None and df_2 is not None:
-    # Convert "Scheduled At" from string to datetime (correct format)
-    df_4["Scheduled At"] = pd.to_datetime(df_4["Scheduled At"], format="%d-%b-%Y", errors="coerce").dt.date
-    df_2["Scheduled At"] = pd.to_datetime(df_2["Scheduled At"], format="%d-%b-%Y", errors="coerce").dt.date
-
-    # Remove NaN values after conversion
+    # "Scheduled At" is already parsed to datetime on load; remove rows that failed to parse
     df_4 = df_4.dropna(subset=["Scheduled At"])
     df_2 = df_2.dropna(subset=["Scheduled At"])
 
-    # Get the current month and year
-    current_month = pd.Timestamp.today().month
-    current_year = pd.Timestamp.today().year
-
     # Filter only current month data
-    df_4 = df_4[df_4["Scheduled At"].apply(lambda x: x.month == current_month and x.year == current_year)]
-    df_2 = df_2[df_2["Scheduled At"].apply(lambda x: x.month == current_month and x.year == current_year)]
+    current_month = pd.Timestamp.today().to_period("M")
+    df_4 = df_4[df_4["Scheduled At"].dt.to_period("M") == current_month]
+    df_2 = df_2[df_2["Scheduled At"].dt.to_period("M") == current_month]
 
     # Count vehicles per date
-    deployed_vehicles = df_4.groupby("Scheduled At")["Vehicle"].count().reset_index(name="Deployed Vehicles")
-    non_deployed_vehicles = df_2.groupby("Scheduled At")["Vehicle"].count().reset_index(name="Non-Deployed Vehicles")
+    deployed_vehicles = df_4.groupby(df_4["Scheduled At"].dt.date)["Vehicle"].count().reset_index(name="Deployed Vehicles")
+    non_deployed_vehicles = df_2.groupby(df_2["Scheduled At"].dt.date)["Vehicle"].count().reset_index(name="Non-Deployed Vehicles")
 
     # Merge both counts
     merged_df = pd.merge(deployed_vehicles, non_deployed_vehicles, on="Scheduled At", how="outer").fillna(0)
@@ -346,54 +438,39 @@ if df_2 is not None:
 
     # Bar Chart: Number of Trips per Hub
     st.subheader("📊 Number of Trips per Hub")
-    df_hub_trips = df_2.groupby('Hub').size().reset_index(name='Trip Count')
-    fig_hub_bar = px.bar(
-        df_hub_trips, 
-        x='Hub', 
-        y='Trip Count', 
-        title="Trips per Hub", 
-        color='Trip Count', 
-        text_auto=True
-    )
-    st.plotly_chart(fig_hub_bar)
+    df_hub_trips = count_by(df_2, 'Hub', 'Trip Count')
+    st.bar_chart(df_hub_trips, x='Hub', y='Trip Count')
 
     # Count Unique Drivers and Their Trip Counts
     st.subheader("🚛 Driver-wise Trip Count for \"App Not Deployed\" in the Current Month")
-    df_driver_trips = df_2.groupby('Driver').size().reset_index(name='Total Trips')
+    df_driver_trips = count_by(df_2, 'Driver', 'Total Trips')
     st.dataframe(df_driver_trips)
 
     # Bar Chart: Driver-wise Trip Count
-    fig_driver_bar = px.bar(
-        df_driver_trips, 
-        x='Driver', 
-        y='Total Trips', 
-        title="Trips per Driver", 
-        color='Total Trips', 
-        text_auto=True
-    )
-    st.plotly_chart(fig_driver_bar)
+    st.bar_chart(df_driver_trips, x='Driver', y='Total Trips')
 
     # SPOC-wise Trip Count
     st.subheader("👤 SPOC-wise Trip Count \"App Not Deployed\" in the Current Month")
     if 'Spoc' in df_2.columns:
-        df_spoc_trips = df_2.groupby('Spoc').size().reset_index(name='Total Trips')
+        df_spoc_trips = count_by(df_2, 'Spoc', 'Total Trips')
         st.dataframe(df_spoc_trips)
 
         # Bar Chart: SPOC-wise Trip Count
-        fig_spoc_bar = px.bar(
-            df_spoc_trips, 
-            x='Spoc', 
-            y='Total Trips', 
-            title="Trips per SPOC", 
-            color='Total Trips', 
-            text_auto=True
-        )
-        st.plotly_chart(fig_spoc_bar)
+        st.bar_chart(df_spoc_trips, x='Spoc', y='Total Trips')
     else:
         st.warning("⚠️ No 'Spoc' column found in the dataset.")
 else:
     st.warning(f"⚠️ No data found for Query ID {query_id_2}.")
 
+# Derive the day for the driver sections below ('Scheduled At' is parsed on load)
+if df_2 is not None and 'Scheduled At' in df_2.columns:
+    df_2['_day'] = df_2['Scheduled At'].dt.normalize()
+
+# Day bounds as Timestamps so the filters below compare datetime64 values directly
+today = pd.Timestamp.today().normalize()
+yesterday = today - pd.Timedelta(days=1)
+start_7d = today - pd.Timedelta(days=6)
+
 ## ------------------- DRIVERS WHO DID NOT DEPLOY THE APP (YESTERDAY & TODAY) -------------------
 if df_1 is not None and df_2 is not None:
     if 'Driver' in df_1.columns and 'Driver' in df_2.columns:
@@ -401,14 +478,11 @@ if df_1 is not None and df_2 is not None:
         
         if 'Scheduled At' in df_2.columns:
             st.success("✅ 'Scheduled At' column exists in Query 3023.")
-            df_2['Scheduled At'] = pd.to_datetime(df_2['Scheduled At'], errors='coerce')
-            yesterday = (pd.Timestamp.today() - pd.Timedelta(days=1)).date()
-            df_2_yesterday = df_2[df_2['Scheduled At'].dt.date == yesterday]
-            
-            drivers_3021 = set(df_1['Driver'].dropna().unique())
-            drivers_3023_yesterday = set(df_2_yesterday['Driver'].dropna().unique())
+            df_2_yesterday = df_2[df_2['_day'] == yesterday]
             
-            common_drivers = sorted(drivers_3021.intersection(drivers_3023_yesterday))
+            # Drivers from yesterday's 3023 data that also appear in 3021
+            mask = df_2_yesterday['Driver'].isin(df_1['Driver'].dropna().unique())
+            common_drivers = df_2_yesterday.loc[mask, 'Driver'].dropna().drop_duplicates().sort_values().tolist()
             
             if common_drivers:
                 st.subheader("🚚 Drivers who have not deployed the app yesterday and today")
@@ -423,33 +497,27 @@ if df_2 is not None:
     if {'Customer', 'Driver', 'Spoc', 'Scheduled At'}.issubset(df_2.columns):
         st.subheader("📅 Drivers who have not deployed the app in the last 7 days")
         
-        # Define last 7 days
-        last_7_days = [(pd.Timestamp.today() - pd.Timedelta(days=i)).date() for i in range(6, -1, -1)]
-        
-        # Ensure 'Scheduled At' column is in datetime format
-        df_2['Scheduled At'] = pd.to_datetime(df_2['Scheduled At'], errors='coerce')
-
-        # Convert 'Scheduled At' to date before filtering
-        df_filtered = df_2[df_2['Scheduled At'].dt.date.isin(last_7_days)]
+        # Filter the last 7 days on the precomputed day
+        df_filtered = df_2[df_2['_day'].between(start_7d, today)]
         
-        # Create pivot table for last 7 days
-        df_pivot = df_filtered.pivot_table(
-            index=['Customer', 'Driver', 'Spoc'], 
-            columns='Scheduled At', 
-            aggfunc='size', 
-            fill_value=0
-        ).reset_index()
-        
-        # Rename columns
+        # Create pivot table for last 7 days, one column per day
+        df_pivot = (
+            df_filtered.groupby(['Customer', 'Driver', 'Spoc', df_filtered['_day'].dt.strftime('%Y-%m-%d')], observed=True)
+            .size()
+            .unstack(fill_value=0)
+            .reset_index()
+        )
         df_pivot.columns.name = None
-        df_pivot.rename(columns=lambda x: str(x) if isinstance(x, pd.Timestamp) else x, inplace=True)
+
+        # Plain strings for the key columns so the Grand Total label can be added
+        df_pivot[['Customer', 'Driver', 'Spoc']] = df_pivot[['Customer', 'Driver', 'Spoc']].astype(str)
 
         # Add Grand Total row
         total_row = df_pivot.select_dtypes(include=['number']).sum()
         total_row['Customer'] = 'Grand Total'
         total_row['Driver'] = ''
         total_row['Spoc'] = ''
-        df_pivot = pd.concat([df_pivot, pd.DataFrame([total_row])], ignore_index=True)
+        df_pivot.loc[len(df_pivot)] = total_row  # pandas still copies the frame to add the row
 
         # Display Pivot Table
         st.dataframe(df_pivot)
@@ -479,17 +547,16 @@ if df_2 is not None:
         st.subheader("📆 Drivers who have not deployed the app today after trip completion")
 
         # Filter data for today
-        today_date = pd.Timestamp.today().date()
-        df_today = df_2[df_2['Scheduled At'].dt.date == today_date]
+        df_today = df_2[df_2['_day'] == today]
 
         # Count occurrences of (Customer, Driver, Spoc)
-        df_today_summary = df_today.groupby(['Customer', 'Driver', 'Spoc']).size().reset_index(name='Count')
+        df_today_summary = df_today.groupby(['Customer', 'Driver', 'Spoc'], observed=True, sort=False).size().reset_index(name='Count')
+        df_today_summary[['Customer', 'Driver', 'Spoc']] = df_today_summary[['Customer', 'Driver', 'Spoc']].astype(str)
 
         # Add Grand Total row
         total_count = df_today_summary['Count'].sum()
-        grand_total_row = pd.DataFrame([{'Customer': 'Grand Total', 'Driver': '', 'Spoc': '', 'Count': total_count}])
         # Append Grand Total to the dataframe
-        df_today_summary = pd.concat([df_today_summary, grand_total_row], ignore_index=True)
+        df_today_summary.loc[len(df_today_summary)] = {'Customer': 'Grand Total', 'Driver': '', 'Spoc': '', 'Count': total_count}
         # Display Today's Data
         st.dataframe(df_today_summary)
 